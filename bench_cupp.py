@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+#
+# Micro-benchmarks for cupp.py
+#
+# Run from the repository root:
+#
+#     python bench_cupp.py [--terms N] [--profiles N] [--repeat N]
+
+import argparse
+import random
+import time
+import timeit
+
+from cupp import ProfileGenerator, Stage, extract_base_terms
+
+def sample_terms(count):
+    """Profile-like base terms: names, words and short numbers"""
+    words = ("anna", "Lee", "chess", "Rex", "Springfield", "ACME", "mascot", "1990", "42", "0707")
+    return [f"{words[i % len(words)]}{i}" if i % 3 else words[i % len(words)] for i in range(count)]
+
+def best(function, repeat):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+def report(name, scalar, batched):
+    print(f"{name:<28} {scalar * 1e3:10.2f} ms {batched * 1e3:10.2f} ms {scalar / batched:8.1f}x")
+
+def bench_transforms(generator, terms, repeat):
+    """Scalar per-item template calls against the batched block kernels"""
+    stages = [
+        Stage("variations", terms, generator.variation_templates),
+        Stage("interest_terms", [t.lower() for t in terms], generator.interest_templates),
+        Stage("combinations", terms, generator._combination_templates(["7", "42", "1990"])),
+    ]
+    for stage in stages:
+        scalar = best(lambda: [generator.expand_item(stage, t) for t in terms], repeat)
+        batched = best(lambda: generator.expand_block(stage, terms), repeat)
+        report(stage.name, scalar, batched)
+
+    scalar = best(lambda: [generator._modify(t) for t in terms], repeat)
+    batched = best(lambda: generator._modify_block(terms), repeat)
+    report("modifiers", scalar, batched)
+
+def sample_profiles(count, seed=1):
+    """Synthetic profiles with a realistic mix of optional fields"""
+    rng = random.Random(seed)
+    firsts = ("Ann", "Bob", "Carla", "Dmitri", "Eve", "Farah", "Gus", "Hana")
+    lasts = ("Lee", "Smith", "Garcia", "Ivanova", "Okafor", "Tanaka")
+    profiles = []
+    for i in range(count):
+        first, last = rng.choice(firsts), rng.choice(lasts)
+        profile = {
+            "first_name": first,
+            "last_name": last,
+            "birthdate": f"19{rng.randint(60, 99)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+            "favorite_numbers": [str(rng.randint(0, 99)) for _ in range(rng.randint(0, 3))],
+            "interests": rng.sample(["chess", "jazz", "hiking", "rust", "tea"], 2),
+            "emails": [f"{first.lower()}.{last.lower()}{i}@example.com"],
+        }
+        if rng.random() < 0.5:
+            profile["pet"] = {"name": rng.choice(("Rex", "Milo", "Luna"))}
+        if rng.random() < 0.5:
+            profile["company"] = {"name": "ACME", "department": "Research"}
+        if rng.random() < 0.3:
+            profile["phones"] = [f"555-01{i % 100:02d}"]
+        if rng.random() < 0.3:
+            profile["children"] = ["Tom", "Lucy"]
+        profiles.append(profile)
+    return profiles
+
+def bench_extraction(generator, profiles):
+    """Base term extraction throughput over a batch of profiles"""
+    extractors = generator.extractors
+    start = time.perf_counter()
+    terms = sum(len(extract_base_terms(profile, extractors)) for profile in profiles)
+    elapsed = time.perf_counter() - start
+    print(f"{len(profiles)} profiles, {terms} terms in {elapsed:.2f} s"
+          f" ({len(profiles) / elapsed:,.0f} profiles/s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="cupp.py micro-benchmarks")
+    parser.add_argument("--terms", type=int, default=10000, help="Terms per block (default: %(default)s)")
+    parser.add_argument("--profiles", type=int, default=100000, help="Profiles per batch (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=5, help="Best of N runs (default: %(default)s)")
+    args = parser.parse_args()
+
+    generator = ProfileGenerator.from_file("cupp.cfg")
+    terms = sample_terms(args.terms)
+
+    print(f"Transform kernels, {args.terms} terms")
+    print(f"{'stage':<28} {'scalar':>13} {'batched':>13} {'speedup':>9}")
+    bench_transforms(generator, terms, args.repeat)
+
+    print()
+    print("Profile extraction")
+    bench_extraction(generator, sample_profiles(args.profiles))
+
+if __name__ == "__main__":
+    main()
@@ -26,13 +26,31 @@
 #
 #  See 'LICENSE' for more information.
 
+import asyncio
+import gzip
+import http.client
+import io
+import json
 import os
+import random
+import re
+import socket
+import tempfile
 import unittest
 from unittest.mock import patch
 
 from cupp import *
 
 
+def run_async(coroutine):
+    """Run a coroutine on a fresh event loop (asyncio.run needs 3.7)"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
 class TestCupp(unittest.TestCase):
     def setUp(self):
 
@@ -65,6 +83,486 @@ class TestCupp(unittest.TestCase):
         read_config("cupp.cfg")
         generate_wordlist_from_profile(profile)
 
+    def test_profile_generator(self):
+        """ a generator does not depend on, nor change, the module globals """
+        profile = {
+            "first_name": "Ann",
+            "last_name": "Lee",
+            "birthdate": "1990-02-03",
+            "favorite_numbers": ["7"],
+            "interests": ["chess"],
+        }
+        generator = ProfileGenerator.from_file("cupp.cfg")
+        candidates = list(generator.generate(profile))
+
+        self.assertIn("Ann1990", candidates)
+        self.assertEqual(len(candidates), len(set(candidates)))
+        self.assertEqual(candidates, list(generator.generate(profile)))
+        self.assertEqual(set(candidates), set(generate_wordlist_from_profile(profile)))
+        self.assertEqual([candidates], list(generator.generate_many([profile])))
+
+        config = load_config("cupp.cfg")
+        config["global"]["wcfrom"] = 12
+        long_only = ProfileGenerator(config)
+        self.assertTrue(all(len(c) >= 12 for c in long_only.generate(profile)))
+        self.assertEqual(CONFIG["global"]["wcfrom"], 4)
+
+        with self.assertRaises(AttributeError):
+            generator.wcfrom = 1
+
+    def test_service(self):
+        """ the service streams the same candidates as the generator """
+        generator = ProfileGenerator.from_file("cupp.cfg")
+        profile = {"first_name": "Ann", "favorite_numbers": [7], "interests": ["chess"]}
+
+        def fetch(port, path, body):
+            connection = http.client.HTTPConnection("127.0.0.1", port)
+            connection.request("POST", path, body=body)
+            response = connection.getresponse()
+            return response.status, response.read().decode()
+
+        async def run():
+            service = WordlistService(generator, chunk_size=100, queue_size=2)
+            server = await service.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            loop = asyncio.get_event_loop()
+            try:
+                return await asyncio.gather(
+                    loop.run_in_executor(None, fetch, port, "/generate", json.dumps(profile)),
+                    loop.run_in_executor(None, fetch, port, "/generate", "[]"),
+                )
+            finally:
+                server.close()
+                await service.cancel()
+                await server.wait_closed()
+                service.close()
+
+        (status, text), (bad_status, _) = run_async(run())
+
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            text.splitlines(), list(generator.generate(normalize_profile(profile)))
+        )
+        self.assertEqual(bad_status, 400)
+
+    def test_service_errors(self):
+        """ bad requests get a 400, failed generation no clean end """
+        generator = ProfileGenerator.from_file("cupp.cfg")
+
+        def fetch(port, body):
+            connection = http.client.HTTPConnection("127.0.0.1", port)
+            connection.request("POST", "/generate", body=body)
+            response = connection.getresponse()
+            try:
+                return response.status, response.read()
+            except http.client.IncompleteRead:
+                return response.status, None
+
+        def raw(port, data):
+            with socket.create_connection(("127.0.0.1", port)) as sock:
+                sock.sendall(data)
+                return sock.recv(100).split(b"\r\n")[0]
+
+        def failing_generate(self, profile, *args, **kwargs):
+            yield "first"
+            raise RuntimeError("boom")
+
+        async def run():
+            service = WordlistService(generator)
+            server = await service.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            loop = asyncio.get_event_loop()
+            try:
+                results = []
+                for body in ('{"first_name": "a", "phones": [5]}', '{"first_name": "a", "favorite_numbers": 5}'):
+                    results.append(await loop.run_in_executor(None, fetch, port, body))
+                for data in (b"GARBAGE\r\n\r\n", b"POST /generate HTTP/1.1\r\nContent-Length: x\r\n\r\n"):
+                    results.append(await loop.run_in_executor(None, raw, port, data))
+                with patch.object(ProfileGenerator, "generate", failing_generate):
+                    results.append(await loop.run_in_executor(None, fetch, port, '{"first_name": "Ann"}'))
+                return results
+            finally:
+                server.close()
+                await service.cancel()
+                await server.wait_closed()
+                service.close()
+
+        with patch("sys.stderr", io.StringIO()):
+            phones, numbers, request_line, length, failed = run_async(run())
+        self.assertEqual(phones[0], 400)
+        self.assertEqual(numbers[0], 400)
+        self.assertEqual(request_line, b"HTTP/1.1 400 Bad Request")
+        self.assertEqual(length, b"HTTP/1.1 400 Bad Request")
+        self.assertEqual(failed, (200, None))
+
+    def test_checkpoint_resume(self):
+        """ an interrupted run resumes without losing or repeating lines """
+        config = load_config("cupp.cfg")
+        config["policy"].update(min_length=10)
+        generator = ProfileGenerator(config)
+        profile = normalize_profile(
+            {"first_name": "Ann", "last_name": "Lee", "favorite_numbers": [7]}
+        )
+        output = "checkpoint_wordlist.txt"
+        checkpoint = "checkpoint_test.json"
+        walk = Keyspace.walk
+
+        def interrupted_walk(self, start=0, stop=None):
+            for n, step in enumerate(walk(self, start, stop)):
+                if n == 15:
+                    raise KeyboardInterrupt
+                yield step
+
+        jobs = [{"profile": profile, "output": output}]
+        with patch.object(Keyspace, "walk", interrupted_walk):
+            with self.assertRaises(KeyboardInterrupt):
+                CheckpointedRun(generator, checkpoint, jobs, interval=0, shard_lines=200).run()
+
+        with self.assertRaises(ValueError):
+            CheckpointedRun.resume(ProfileGenerator.from_file("cupp.cfg"), checkpoint)
+        run = CheckpointedRun.resume(generator, checkpoint, shard_lines=200)
+        remaining = run.remaining()
+        self.assertTrue(0 < remaining < generator.keyspace(profile).size)
+        stream = io.StringIO()
+        run.progress = Progress(remaining, interval=60, json_lines=True, stream=stream)
+        with run.progress:
+            run.run()
+        report = json.loads(stream.getvalue().splitlines()[-1])
+        self.assertEqual(report["position"], remaining)
+        self.assertEqual(report["total"], remaining)
+
+        with open(output) as f:
+            written = f.read().splitlines()
+        os.remove(output)
+        self.assertEqual(written, list(generator.generate(profile)))
+        self.assertFalse(os.path.isfile(checkpoint))
+
+    def test_stream_to_stdout(self):
+        """ candidates stream in order and a closed pipe stops quietly """
+        generator = ProfileGenerator.from_file("cupp.cfg")
+        profile = {"first_name": "Ann", "last_name": "Lee"}
+        candidates = list(generator.generate(profile))
+
+        stream = io.BytesIO()
+        self.assertEqual(stream_to_stdout(iter(candidates), stream), len(candidates))
+        self.assertEqual(stream.getvalue().decode().splitlines(), candidates)
+
+        read_end, write_end = os.pipe()
+        os.close(read_end)
+        with os.fdopen(write_end, "wb") as pipe:
+            self.assertEqual(stream_to_stdout(iter(candidates), pipe), 0)
+
+    def test_policy(self):
+        """ policy filtering and pruning keep exactly the valid candidates """
+        profile = normalize_profile(
+            {"first_name": "Ann", "last_name": "Lee", "favorite_numbers": [7],
+             "interests": ["chess"], "birthdate": "1990-02-03"}
+        )
+        config = load_config("cupp.cfg")
+        everything = list(ProfileGenerator(config).generate(profile))
+
+        config["policy"].update(min_length=8, require_upper=True, require_digit=True)
+        strict = list(ProfileGenerator(config).generate(profile))
+
+        expected = [
+            c for c in everything
+            if len(c) >= 8 and re.search("[A-Z]", c) and re.search("[0-9]", c)
+        ]
+        self.assertTrue(strict)
+        self.assertEqual(strict, expected)
+
+        config["policy"].update(require_special=True)
+        special = ProfileGenerator(config)
+        self.assertTrue(special.accept("Ann1990!!"))
+        self.assertFalse(special.accept("Ann1990xx"))
+
+    def test_keyspace_shards(self):
+        """ shards cover exactly the single-node output """
+        generator = ProfileGenerator.from_file("cupp.cfg")
+        profile = normalize_profile(
+            {"first_name": "Ann", "last_name": "Lee", "favorite_numbers": [7],
+             "interests": ["chess"], "birthdate": "1990-02-03"}
+        )
+        keyspace = generator.keyspace(profile)
+        everything = list(generator.generate(profile))
+
+        shards = [
+            set(generator.generate(profile, *keyspace.partition(i, 7)))
+            for i in range(1, 8)
+        ]
+        self.assertEqual(set().union(*shards), set(everything))
+        self.assertEqual(keyspace.partition(7, 7)[1], len(keyspace))
+
+        window = [c for _, _, cs in keyspace.walk(1000, 1100) for c in cs]
+        by_index = [keyspace.candidate(k) for k in range(1000, 1100)]
+        self.assertEqual(window, [c for c in by_index if c is not None])
+
+        # a keyspace built once is reused instead of rebuilt
+        with patch.object(ProfileGenerator, "keyspace", side_effect=AssertionError):
+            self.assertEqual(list(generator.generate(profile, keyspace=keyspace)), everything)
+
+        with patch("sys.stderr", io.StringIO()), self.assertRaises(SystemExit):
+            get_parser().parse_args(["-p", "profiles.json", "--skip", "-1"])
+
+    def test_sample(self):
+        """ sampling is uniform over positions, distinct and reproducible """
+        generator = ProfileGenerator.from_file("cupp.cfg")
+        profile = normalize_profile(
+            {"first_name": "Ann", "last_name": "Lee", "favorite_numbers": [7],
+             "interests": ["chess"], "birthdate": "1990-02-03"}
+        )
+        keyspace = generator.keyspace(profile)
+        everything = set(generator.generate(profile))
+
+        drawn = keyspace.sample(200, random.Random(5))
+        self.assertEqual(len(drawn), 200)
+        self.assertEqual(len(set(drawn)), 200)
+        self.assertTrue(set(drawn) <= everything)
+        self.assertEqual(drawn, keyspace.sample(200, random.Random(5)))
+
+        # small ranges are enumerated and sampled exactly
+        small = keyspace.sample(1000, random.Random(5), 0, 50)
+        window = {c for _, _, cs in keyspace.walk(0, 50) for c in cs}
+        self.assertEqual(set(small), window)
+
+        # "0070" fills 2 of these 8 positions; drawing (n=1) and
+        # enumerating (n=2) weight it the same way
+        self.assertEqual([keyspace.candidate(i) for i in range(10, 18)].count("0070"), 2)
+        for n in (1, 2):
+            first = [keyspace.sample(n, random.Random(seed), 10, 18)[0] for seed in range(2000)]
+            self.assertAlmostEqual(first.count("0070") / 2000, 0.25, delta=0.04)
+
+        for count in ("0", "-5"):
+            with patch("sys.stderr", io.StringIO()), self.assertRaises(SystemExit):
+                get_parser().parse_args(["-p", "profiles.json", "--sample", count])
+        self.assertEqual(get_parser().parse_args(["-p", "profiles.json", "--sample", "3"]).sample, 3)
+
+    def test_password_model(self):
+        """ trained model emits profile candidates most likely first """
+        corpus = ["monkey12", "monkey12", "Dragon12", "dragon99", "Shadow!", "123456", "x"]
+        model = PasswordModel.train(corpus)
+        self.assertEqual(model.passwords, 7)
+        self.assertEqual(model.tables["structure"]["L6D2"], 4)
+        self.assertEqual(model.tables["C6"], {"LLLLLL": 3, "ULLLLL": 2})
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "cupp.model")
+            model.save(filename)
+            loaded = PasswordModel.load(filename)
+
+            with open(filename, "r+b") as f:
+                f.seek(PasswordModel.HEADER.size)
+                f.write(b"garbage")
+            with self.assertRaises(ValueError):
+                PasswordModel.load(filename)
+            with patch("sys.stdout", io.StringIO()), self.assertRaises(SystemExit):
+                load_model(os.path.join(tmp, "missing.model"))
+        self.assertEqual(loaded.tables, model.tables)
+        self.assertEqual(loaded.passwords, 7)
+
+        guesses = list(loaded.guesses(["Ashley", "carter"], ["77"]))
+        self.assertEqual(guesses[:4], ["123456", "ashley77", "carter77", "ashley12"])
+        self.assertEqual(len(guesses), len(set(guesses)))
+        # 2 terms x 2 masks x (3 digit runs + 1 special run) + 1 digit run
+        self.assertEqual(len(guesses), 17)
+
+        # Extra profile fields reach the model through the extractors
+        profile = {"first_name": "Ann", "children": ["Carter"]}
+        extractors = field_extractors({"extra": {"children": "name"}})
+        self.assertIn("carter12", model.generate(profile, extractors=extractors))
+        self.assertNotIn("carter12", model.generate(profile))
+
+    def test_progress(self):
+        """ progress counters add up over several profiles """
+        generator = ProfileGenerator.from_file("cupp.cfg")
+        profile = normalize_profile({"first_name": "Ann", "last_name": "Lee", "favorite_numbers": [7]})
+        size = generator.keyspace(profile).size
+
+        stream = io.StringIO()
+        with Progress(2 * size, interval=3600, json_lines=True, stream=stream) as progress:
+            first = list(generator.generate(profile, progress=progress))
+            self.assertEqual(progress.position, size)
+            second = list(generator.generate(profile, progress=progress))
+        self.assertEqual(first, list(generator.generate(profile)))
+
+        report = json.loads(stream.getvalue().splitlines()[-1])
+        self.assertEqual(report["event"], "done")
+        self.assertEqual(report["position"], report["total"])
+        self.assertEqual(report["candidates"] - report["duplicates"], len(first) + len(second))
+
+    def test_batch_kernels(self):
+        """ batched template kernels match the scalar templates exactly """
+        generator = ProfileGenerator.from_file("cupp.cfg")
+        terms = ["anna", "Lee", "1990", "42", "ΟΔΟΣ", "Straße", "İlker", "a\0b", "", "x_7"]
+        stages = [
+            Stage("variations", terms, generator.variation_templates),
+            Stage("interest_terms", terms, generator.interest_templates),
+            Stage("combinations", terms, generator._combination_templates(["7", "1990"])),
+            Stage("dictionary", terms, generator.dictionary_templates),
+        ]
+        for stage in stages:
+            for block in (terms, terms[:7], terms[:1], []):
+                self.assertEqual(
+                    generator.expand_block(stage, block),
+                    [tuple(generator.expand_item(stage, t)) for t in block],
+                )
+        self.assertEqual(generator._modify_block(terms), [generator._modify(t) for t in terms])
+
+        cached = generator.with_cache(TermCache())
+        stage = stages[0]
+        first = cached.expand_items(stage, terms[:4])
+        self.assertEqual(cached.expand_items(stage, terms), generator.expand_block(stage, terms))
+        self.assertEqual(cached.cache.hits, 4)
+        self.assertEqual(first, generator.expand_block(stage, terms[:4]))
+
+    def test_field_extractors(self):
+        """ extra profile fields come from the config and from plugins """
+        config = load_config("cupp.cfg")
+        config["fields"]["extra"].update(children="name", employee_id="number")
+        generator = ProfileGenerator(config)
+        profile = {"first_name": "Ann", "last_name": "Lee", "children": ["Lucy May"], "employee_id": "E-2041"}
+        terms = extract_base_terms(profile, generator.extractors)
+        self.assertTrue({"LucyMay", "AnnLucyMay", "2041", "Ann2041", "Lee2041"} <= terms)
+        self.assertNotIn("LucyMay", extract_base_terms(profile))
+
+        @register_field_extractor("badge", ("badge",), ("badge code",))
+        def extract_badge(profile, collector):
+            collector.add_term(profile["badge"].upper())
+        try:
+            generator = ProfileGenerator.from_file("cupp.cfg")
+            self.assertIn("XK42", extract_base_terms({"first_name": "Ann", "badge": "xk42"}, generator.extractors))
+        finally:
+            del FIELD_EXTRACTORS["badge"]
+
+        with self.assertRaises(ValueError):
+            field_extractors({"extra": {"children": "nickname"}})
+
+    def test_crack_hashes(self):
+        """ in-process cracking finds generated passwords """
+        self.assertEqual(md4(b"abc").hex(), "a448017aaf21d8525fc10ae87aa6729d")
+        self.assertEqual(HASH_TYPES["ntlm"]("password"), "8846f7eaee8fb117ad06bdd830b7586c")
+
+        generator = ProfileGenerator.from_file("cupp.cfg")
+        candidates = list(generator.generate({"first_name": "Ann", "last_name": "Lee"}))
+        targets = {
+            HASH_TYPES["sha1"](candidates[3]): candidates[3],
+            HASH_TYPES["sha1"](candidates[-1]): candidates[-1],
+        }
+
+        cracked = crack_hashes(iter(candidates), set(targets), "sha1", workers=2, batch_size=50)
+        self.assertEqual(cracked, targets)
+
+    def test_audit(self):
+        """ audits recognise every generated candidate """
+        generator = ProfileGenerator.from_file("cupp.cfg")
+        profile = normalize_profile(
+            {"first_name": "Ann", "last_name": "Lee", "favorite_numbers": [7],
+             "interests": ["chess"], "birthdate": "1990-02-03",
+             "address": {"city": "Boston"}}
+        )
+        index = AuditIndex(generator, profile)
+
+        for candidate in list(generator.generate(profile))[::25]:
+            self.assertIsNotNone(index.audit(candidate), candidate)
+
+        match = audit_password("B0st0n1990!", profile, generator)
+        self.assertEqual(match.terms, ["boston", "1990"])
+        self.assertEqual(
+            match.rules, ["case:capitalize", "leet:boston", "term:1990", "suffix:!"]
+        )
+        self.assertIsNone(index.audit("correcthorse"))
+
+    def test_audit_long_leet(self):
+        """ audits undo leet on terms with many leet characters """
+        generator = ProfileGenerator.from_file("cupp.cfg")
+        profile = normalize_profile(
+            {"first_name": "Sebastian", "last_name": "Lee", "job_title": "Data Analyst"}
+        )
+        index = AuditIndex(generator, profile)
+
+        candidates = list(generator.generate(profile))
+        self.assertIn("$38@$71@n", candidates)
+        for candidate in candidates:
+            self.assertIsNotNone(index.audit(candidate), candidate)
+
+        match = audit_password("$38@$71@n", profile, generator)
+        self.assertEqual(match.terms, ["sebastian"])
+        self.assertEqual(match.rules, ["leet:sebastian"])
+
+    def test_term_cache(self):
+        """ memoized expansions are shared across profiles and runs """
+        profiles = [
+            {"first_name": name, "last_name": "Lee", "interests": ["chess"],
+             "company": {"name": "Acme Corp", "department": "Finance"}}
+            for name in ("Ann", "Bob", "Cat")
+        ]
+        plain = ProfileGenerator.from_file("cupp.cfg")
+        expected = [list(plain.generate(profile)) for profile in profiles]
+
+        cache = TermCache(maxsize=1000)
+        cached = plain.with_cache(cache)
+        self.assertEqual(list(cached.generate_many(profiles)), expected)
+        self.assertGreater(cache.hit_rate, 0.3)
+
+        # Only reuse across profiles counts as a hit
+        disjoint = TermCache(maxsize=1000)
+        list(plain.with_cache(disjoint).generate_many([
+            {"first_name": name, "last_name": last, "interests": [interest]}
+            for name, last, interest in (("Ann", "Lee", "chess"), ("Bob", "Smith", "jazz"))
+        ]))
+        self.assertEqual(disjoint.hits, 0)
+        self.assertGreater(disjoint.misses, 0)
+        self.assertEqual(
+            cached.modifiers(["Acme", "chess"]), plain.modifiers(["Acme", "chess"])
+        )
+
+        path = "term_cache_test.db"
+        try:
+            first = TermCache(path=path)
+            list(plain.with_cache(first).generate(profiles[0]))
+            first.flush()
+            shared = TermCache(path=path)
+            self.assertEqual(list(plain.with_cache(shared).generate(profiles[0])), expected[0])
+            self.assertEqual(shared.misses, 0)
+        finally:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    def test_dictionary_index(self):
+        """ indexed dictionaries answer prefix and substring queries """
+        with tempfile.TemporaryDirectory() as tmp:
+            os.mkdir(os.path.join(tmp, "english"))
+            with gzip.open(os.path.join(tmp, "english", "words.gz"), "wb") as f:
+                f.write(b"Bostonian\nboston\napple\nchessboard\nzebra\n")
+            with open(os.path.join(tmp, "english", "extra.txt"), "wb") as f:
+                f.write(b"apple\nbostonterrier\nmychess\n")
+
+            filename = os.path.join(tmp, "words.idx")
+            count = DictionaryIndex.build(dictionary_sources(tmp), filename, chunk_words=2)
+            self.assertEqual(count, 7)
+
+            index = DictionaryIndex(filename)
+            self.assertEqual(index.prefix("Boston"), ["boston", "bostonian", "bostonterrier"])
+            self.assertEqual(index.containing("chess"), ["chessboard", "mychess"])
+            self.assertEqual(index.containing("zebra"), ["zebra"])
+            self.assertEqual(index.containing("nothing"), [])
+            self.assertEqual(index.containing("ard"), ["chessboard"])
+            self.assertEqual(index.containing("ap"), ["apple"])
+            self.assertEqual(index.containing("o", limit=2), ["boston", "bostonian"])
+
+            generator = ProfileGenerator(load_config("cupp.cfg"), dictionary=index)
+            candidates = set(generator.generate(
+                {"first_name": "Ann", "interests": ["chess"], "address": {"city": "Boston"}}
+            ))
+            self.assertTrue({"chessboard", "Mychess", "bostonterrier"} <= candidates)
+            index.close()
+
+            config = load_config("cupp.cfg")
+            config["dictionary"] = {"index": os.path.join(tmp, "missing.idx")}
+            with self.assertRaises(ValueError):
+                ProfileGenerator(config)
+
     def test_parser(self):
         """ downloads a file and checks if it exists """
 